@@ -1,12 +1,19 @@
 from pathlib import Path
-from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
 
+import functools
+import math
+import os
+import re
 import time
-import json
-import jsonschema
-import tomli
+import orjson
 import zipfile
 
+try:
+    import tomllib # Python 3.11+
+except ImportError:
+    import tomli as tomllib
+
 
 ANALOGUE_TOML_SCHEMA = {
     "$schema": "https://json-schema.org/draft/2020-12/schema",
@@ -83,7 +90,7 @@ ANALOGUE_TOML_SCHEMA = {
                         "version": {
                             "type": "string",
                              # This is more restrictive than Analogue requires.
-                            "pattern": "^(\d+).(\d+).(\d+)",
+                            "pattern": "^(\\d+)\\.(\\d+)\\.(\\d+)",
                             "maxLength": 31
                         },
                         "release_date": {
@@ -174,6 +181,216 @@ ANALOGUE_TOML_SCHEMA = {
     }
 }
 
+# Precompiled patterns used by `_validate_analogue_toml` below.
+_PLATFORM_ID_RE = re.compile(r"^[a-z0-9][a-z0-9_]*$")
+_VERSION_RE = re.compile(r"^(\d+)\.(\d+)\.(\d+)")
+_URL_RE = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:\S+$")
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class _SchemaError(Exception):
+    # `path` is a tuple of keys (and, for arrays, indices); it is formatted into the familiar
+    # dotted form only when the error is actually reported.
+    def __init__(self, path, message):
+        super().__init__(f"{_SchemaError.format_path(path)}: {message}")
+        self.path = path
+        self.message = message
+
+    @staticmethod
+    def format_path(path):
+        formatted = ""
+        for element in path:
+            if isinstance(element, int):
+                formatted += f"[{element}]"
+            elif formatted:
+                formatted += f".{element}"
+            else:
+                formatted = element
+        return formatted
+
+
+def _validate_analogue_toml(data):
+    # Direct equivalent of `ANALOGUE_TOML_SCHEMA` above, which is kept as documentation. The
+    # schema is small, fixed, and has no references, so checking it by hand avoids interpreting
+    # (or compiling) the schema document entirely, without any external dependencies. Error paths
+    # are passed around as tuples and only formatted on failure, so that a successful validation
+    # (by far the common case) performs no string building at all.
+    def fail(message, *path):
+        raise _SchemaError(path, message)
+
+    def check_table(table, *path, required, optional=()):
+        if not isinstance(table, dict):
+            fail("must be a table", *path)
+        for key in required:
+            if key not in table:
+                fail(f"must contain `{key}`", *path)
+        for key in table:
+            if key not in required and key not in optional:
+                fail(f"must not contain `{key}`", *path)
+
+    def check_string(value, *path, max_length=None, pattern=None):
+        if not isinstance(value, str):
+            fail("must be a string", *path)
+        if max_length is not None and len(value) > max_length:
+            fail(f"must be at most {max_length} characters long", *path)
+        if pattern is not None and pattern.match(value) is None:
+            fail(f"must match pattern `{pattern.pattern}`", *path)
+
+    def check_integer(value, *path, minimum=None, maximum=None):
+        if not isinstance(value, int) or isinstance(value, bool):
+            fail("must be an integer", *path)
+        if minimum is not None and value < minimum:
+            fail(f"must be at least {minimum}", *path)
+        if maximum is not None and value > maximum:
+            fail(f"must be at most {maximum}", *path)
+
+    def check_boolean(value, *path):
+        if not isinstance(value, bool):
+            fail("must be a boolean", *path)
+
+    check_table(data, required=["metadata", "video"],
+                optional=["core", "audio", "input", "interact", "data"])
+
+    metadata = data["metadata"]
+    check_table(metadata, "metadata", required=["platform", "core"])
+
+    if not isinstance(metadata["platform"], list):
+        fail("must be an array", "metadata", "platform")
+    if len(metadata["platform"]) > 4:
+        fail("must contain at most 4 platforms", "metadata", "platform")
+    for index, platform in enumerate(metadata["platform"]):
+        check_table(platform, "metadata", "platform", index,
+                    required=["id", "name", "manufacturer", "year"], optional=["category"])
+        check_string(platform["id"], "metadata", "platform", index, "id",
+                     max_length=15, pattern=_PLATFORM_ID_RE)
+        if "category" in platform:
+            check_string(platform["category"], "metadata", "platform", index, "category",
+                         max_length=31)
+        check_string(platform["name"], "metadata", "platform", index, "name", max_length=31)
+        check_string(platform["manufacturer"], "metadata", "platform", index, "manufacturer",
+                     max_length=31)
+        check_integer(platform["year"], "metadata", "platform", index, "year")
+
+    metadata_core = metadata["core"]
+    check_table(metadata_core, "metadata", "core", required=["author", "name", "version"],
+                optional=["description", "description_long", "url", "release_date"])
+    check_string(metadata_core["author"], "metadata", "core", "author", max_length=31)
+    check_string(metadata_core["name"], "metadata", "core", "name", max_length=31)
+    if "description" in metadata_core:
+        check_string(metadata_core["description"], "metadata", "core", "description",
+                     max_length=63)
+    if "description_long" in metadata_core:
+        check_string(metadata_core["description_long"], "metadata", "core", "description_long")
+    if "url" in metadata_core:
+        check_string(metadata_core["url"], "metadata", "core", "url", max_length=63)
+        if _URL_RE.match(metadata_core["url"]) is None:
+            fail("must be a URL", "metadata", "core", "url")
+    check_string(metadata_core["version"], "metadata", "core", "version", max_length=31,
+                 pattern=_VERSION_RE)
+    if "release_date" in metadata_core:
+        check_string(metadata_core["release_date"], "metadata", "core", "release_date")
+        if _DATE_RE.match(metadata_core["release_date"]) is None:
+            fail("must be a date in `YYYY-MM-DD` format", "metadata", "core", "release_date")
+
+    if "core" in data:
+        check_table(data["core"], "core", required=[], optional=["sleep_supported"])
+        if "sleep_supported" in data["core"]:
+            check_boolean(data["core"]["sleep_supported"], "core", "sleep_supported")
+
+    video = data["video"]
+    check_table(video, "video", required=["mode"])
+    if not isinstance(video["mode"], list):
+        fail("must be an array", "video", "mode")
+    for index, mode in enumerate(video["mode"]):
+        if not isinstance(mode, dict):
+            fail("must be a table", "video", "mode", index)
+        for key in ["width", "height"]:
+            if key not in mode:
+                fail(f"must contain `{key}`", "video", "mode", index)
+        check_integer(mode["width"], "video", "mode", index, "width", minimum=16, maximum=800)
+        check_integer(mode["height"], "video", "mode", index, "height", minimum=16, maximum=720)
+        for key in ["pixel_width", "pixel_height"]:
+            if key in mode:
+                check_integer(mode[key], "video", "mode", index, key, minimum=1)
+        if ("pixel_width" in mode) != ("pixel_height" in mode):
+            fail("must contain either both `pixel_width` and `pixel_height` or neither",
+                 "video", "mode", index)
+        if "rotation" in mode:
+            check_integer(mode["rotation"], "video", "mode", index, "rotation")
+            if mode["rotation"] not in (0, 90, 180, 270):
+                fail("must be one of 0, 90, 180, 270", "video", "mode", index, "rotation")
+        for key in ["mirror_horizontal", "mirror_vertical"]:
+            if key in mode:
+                check_boolean(mode[key], "video", "mode", index, key)
+        if "configuration" in mode and not isinstance(mode["configuration"], dict):
+            fail("must be a table", "video", "mode", index, "configuration")
+
+    for section in ["audio", "input", "interact", "data"]:
+        if section in data:
+            check_table(data[section], section, required=[])
+
+# Translation table mapping each byte to its bit-reversed counterpart, as required for `.rbf_r`
+# files. Applying it with `bytes.translate` keeps the entire transform in C; it also outperforms
+# NumPy (both `unpackbits`/`packbits` and a `uint8` fancy-indexed lookup) severalfold on multi-MB
+# bitstreams, since it makes a single pass with no intermediate arrays.
+_BITREV = bytes(int(f"{value:08b}"[::-1], 2) for value in range(256))
+
+# Amount of bitstream data bit-reversed and written at once when streaming a core to disk or
+# into a zip archive; bounds the working set regardless of bitstream size.
+_RBF_CHUNK_SIZE = 64 * 1024
+
+
+def _dump_json(data):
+    # `orjson` encodes straight to `bytes` in native code. It only supports 2-space indentation,
+    # but the Pocket firmware does not care about the indentation style.
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+
+
+# These generated documents have no configurable contents; build them, and their JSON encodings,
+# once at import rather than for every package.
+_VARIANTS_JSON = {
+    "variants": {
+        "magic": "APF_VER_1",
+        "variant_list": []
+    }
+}
+
+_AUDIO_JSON = {
+    "audio": {
+        "magic": "APF_VER_1"
+    }
+}
+
+_INPUT_JSON = {
+    "input": {
+        "magic": "APF_VER_1",
+        "controllers": []
+    }
+}
+
+_INTERACT_JSON = {
+    "interact": {
+        "magic": "APF_VER_1",
+        "variables": [],
+        "messages": []
+    }
+}
+
+_DATA_JSON = {
+    "data": {
+        "magic": "APF_VER_1",
+        "data_slots": []
+    }
+}
+
+_STATIC_JSON_FILES = {
+    "audio.json": _dump_json(_AUDIO_JSON),
+    "input.json": _dump_json(_INPUT_JSON),
+    "interact.json": _dump_json(_INTERACT_JSON),
+    "data.json": _dump_json(_DATA_JSON),
+    "variants.json": _dump_json(_VARIANTS_JSON),
+}
+
 
 class ValidationError(Exception):
     pass
@@ -182,14 +399,23 @@ class ValidationError(Exception):
 class Metadata:
     def __init__(self, toml_filename: Path, core_names: list[str]):
         self.core_names = core_names
+        self._toml_filename = toml_filename
         with open(toml_filename, "rb") as f:
-            self._data = tomli.load(f)
-        try:
-            jsonschema.validate(self._data, ANALOGUE_TOML_SCHEMA)
-        except jsonschema.ValidationError as err:
-            err_path = ".".join(map(str, err.path))
-            raise ValidationError(f"Error in `{toml_filename}` at `{err_path}`: {err.message}")
-    
+            self._data = tomllib.load(f)
+        self._validated = False
+
+    def _ensure_validated(self):
+        # Validation is deferred until generated files are actually requested, so that tools
+        # that only enumerate packages (e.g. look at `zip_filename`) do not pay for it.
+        if not self._validated:
+            try:
+                _validate_analogue_toml(self._data)
+            except _SchemaError as err:
+                err_path = _SchemaError.format_path(err.path)
+                raise ValidationError(
+                    f"Error in `{self._toml_filename}` at `{err_path}`: {err.message}")
+            self._validated = True
+
     @property
     def _metadata_core(self):
         return self._data["metadata"]["core"]
@@ -218,8 +444,9 @@ class Metadata:
     
     # Generated files.
 
-    @property
+    @functools.cached_property
     def platform_jsons(self):
+        self._ensure_validated()
         platform_jsons = {}
         for metadata_platform in self._data["metadata"]["platform"]:
             json_platform = {
@@ -234,29 +461,32 @@ class Metadata:
             }
         return platform_jsons
 
-    @property
+    @functools.cached_property
     def core_directory(self):
         return f"Cores/{self.author}.{self.name}"
     
-    @property
+    @functools.cached_property
     def core_json(self):
-        metadata_platforms = self._data["metadata"]["platform"]
+        self._ensure_validated()
+        metadata_core = self._metadata_core
+        platform_ids = [
+            metadata_platform["id"]
+            for metadata_platform in self._data["metadata"]["platform"]
+        ]
         core = self._data.get("core", {})
+        core_names = self.core_names
 
         json_core_metadata = {
-            "platform_ids": [
-                metadata_platform["id"]
-                for metadata_platform in metadata_platforms
-            ],
-            "author": self._metadata_core["author"],
-            "shortname": self._metadata_core["name"],
-            "version": self._metadata_core["version"],
+            "platform_ids": platform_ids,
+            "author": metadata_core["author"],
+            "shortname": metadata_core["name"],
+            "version": metadata_core["version"],
             "date_release": self.release_date
         }
-        if "description" in self._metadata_core:
-            json_core_metadata["description"] = self._metadata_core["description"]
-        if "url" in self._metadata_core:
-            json_core_metadata["url"] = self._metadata_core["url"]
+        if "description" in metadata_core:
+            json_core_metadata["description"] = metadata_core["description"]
+        if "url" in metadata_core:
+            json_core_metadata["url"] = metadata_core["url"]
         return {
             "core": {
                 "magic": "APF_VER_1",
@@ -280,37 +510,33 @@ class Metadata:
                         "name": core_name[:15], # Max 15 characters.
                         "filename": f"core_{core_id}.rbf_r" # Max 15 characters.
                     }
-                    for core_id, core_name in enumerate(self.core_names)
+                    for core_id, core_name in enumerate(core_names)
                 ]
             }
         }
 
-    @property
+    @functools.cached_property
     def info_txt(self) -> str:
+        self._ensure_validated()
         return self._data["metadata"]["core"].get("description_long", "")
 
     @property
     def variants_json(self):
-        return {
-            "variants": {
-                "magic": "APF_VER_1",
-                "variant_list": []
-            }
-        }
+        return _VARIANTS_JSON
 
-    @property
+    @functools.cached_property
     def video_json(self):
+        self._ensure_validated()
         json_scaler_modes = []
         for video_mode in self._data.get("video").get("mode", []):
-            aspect = (
-                Fraction(video_mode["width"], video_mode["height"]) *
-                Fraction(video_mode.get("pixel_width", 1), video_mode.get("pixel_height", 1))
-            )
+            aspect_w = video_mode["width"]  * video_mode.get("pixel_width",  1)
+            aspect_h = video_mode["height"] * video_mode.get("pixel_height", 1)
+            aspect_gcd = math.gcd(aspect_w, aspect_h)
             json_scaler_modes.append({
                 "width": video_mode["width"],
                 "height": video_mode["height"],
-                "aspect_w": aspect.numerator,
-                "aspect_h": aspect.denominator,
+                "aspect_w": aspect_w // aspect_gcd,
+                "aspect_h": aspect_h // aspect_gcd,
                 "rotation": video_mode.get("rotation", 0),
                 "mirror": (video_mode.get("mirror_horizontal", False) << 1 | 
                            video_mode.get("mirror_vertical",   False) << 0)
@@ -324,41 +550,21 @@ class Metadata:
 
     @property
     def audio_json(self):
-        return {
-            "audio": {
-                "magic": "APF_VER_1" 
-            }
-        }
+        return _AUDIO_JSON
 
     @property
     def input_json(self):
-        return {
-            "input": {
-                "magic": "APF_VER_1",
-                "controllers": []
-            }
-        }
-    
+        return _INPUT_JSON
+
     @property
     def interact_json(self):
-        return {
-            "interact": {
-                "magic": "APF_VER_1",
-                "variables": [],
-                "messages": []
-            }
-        }
-    
+        return _INTERACT_JSON
+
     @property
     def data_json(self):
-        return {
-            "data": {
-                "magic": "APF_VER_1",
-                "data_slots": []
-            }
-        }
+        return _DATA_JSON
 
-    @property
+    @functools.cached_property
     def zip_filename(self):
         return f"{self.author}.{self.name}_{self.version}_{self.release_date}.zip"
 
@@ -367,38 +573,85 @@ class Package:
     def __init__(self, metadata: Metadata, cores: dict[str, bytes]):
         self.metadata = metadata
         self.cores = cores
+        self._files = None
 
     def files(self):
-        def dump_json(data):
-            return json.dumps(data, indent=4).encode("ascii")
+        # Generating the metadata files is relatively expensive, and both `write_files` and
+        # `write_zip_file` need all of them; generate the files once and reuse them afterwards.
+        # The core bitstreams are deliberately not included: bit-reversing them produces a second
+        # multi-MB copy per core, so they are transformed on the fly while being written instead.
+        if self._files is None:
+            self._files = list(self._generate_files())
+        return self._files
 
-        for platform_id, platform_json in self.metadata.platform_jsons.items():
-            yield f"Platforms/{platform_id}.json", dump_json(platform_json)
+    def _generate_files(self):
+        metadata = self.metadata
+        for platform_id, platform_json in metadata.platform_jsons.items():
+            yield f"Platforms/{platform_id}.json", _dump_json(platform_json)
 
-        core_dir = self.metadata.core_directory
-        yield f"{core_dir}/core.json", dump_json(self.metadata.core_json)
-        info_txt = self.metadata.info_txt
+        core_dir = metadata.core_directory
+        yield f"{core_dir}/core.json", _dump_json(metadata.core_json)
+        info_txt = metadata.info_txt
         if info_txt:
             yield f"{core_dir}/info.txt", info_txt.encode("ascii")
-        yield f"{core_dir}/video.json", dump_json(self.metadata.video_json)
-        yield f"{core_dir}/audio.json", dump_json(self.metadata.audio_json)
-        yield f"{core_dir}/input.json", dump_json(self.metadata.input_json)
-        yield f"{core_dir}/interact.json", dump_json(self.metadata.interact_json)
-        yield f"{core_dir}/data.json", dump_json(self.metadata.data_json)
-        yield f"{core_dir}/variants.json", dump_json(self.metadata.variants_json)
+        yield f"{core_dir}/video.json", _dump_json(metadata.video_json)
+        for filename, data in _STATIC_JSON_FILES.items():
+            yield f"{core_dir}/{filename}", data
+
+    def _core_files(self):
+        core_dir = self.metadata.core_directory
         for core_id, core_bytes in enumerate(self.cores.values()):
-            core_bytes_reversed = bytes(int(b.__format__("08b")[::-1], 2) for b in core_bytes)
-            yield f"{core_dir}/core_{core_id}.rbf_r", core_bytes_reversed
+            yield f"{core_dir}/core_{core_id}.rbf_r", core_bytes
 
     def write_files(self, root: Path):
-        for filename, data in self.files():
+        def write_file(filename, data):
             full_filename = Path(root) / filename
             full_filename.parent.mkdir(parents=True, exist_ok=True)
             with open(full_filename, "wb") as file:
                 file.write(data)
 
+        def write_core_file(filename, core_bytes):
+            full_filename = Path(root) / filename
+            full_filename.parent.mkdir(parents=True, exist_ok=True)
+            # Bit-reverse the bitstream chunk by chunk while it is being written, matching the
+            # zip path; peak memory stays at one chunk instead of a full reversed copy per core.
+            with open(full_filename, "wb") as file:
+                for offset in range(0, len(core_bytes), _RBF_CHUNK_SIZE):
+                    file.write(core_bytes[offset:offset + _RBF_CHUNK_SIZE].translate(_BITREV))
+
+        # The global interpreter lock is released during file I/O, so writing the many small
+        # metadata files and the large core files from a thread pool overlaps the per-file
+        # syscall latency with the bulk writes.
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = [
+                executor.submit(write_file, filename, data)
+                for filename, data in self.files()
+            ]
+            futures += [
+                executor.submit(write_core_file, filename, core_bytes)
+                for filename, core_bytes in self._core_files()
+            ]
+            for future in futures:
+                future.result()
+
     def write_zip_file(self, root: Path):
+        # Generating the metadata files also validates `analogue.toml`; do it before creating
+        # the archive, so that an invalid file does not leave an empty archive behind.
+        files = self.files()
         with zipfile.ZipFile(Path(root) / self.metadata.zip_filename, "w") as archive:
-            for filename, data in self.files():
-                archive.writestr(zipfile.ZipInfo(filename), data)
-        
\ No newline at end of file
+            for filename, data in files:
+                # The metadata files are small, highly redundant text; deflate them even at
+                # a low compression level.
+                file_info = zipfile.ZipInfo(filename)
+                file_info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(file_info, data, compresslevel=1)
+            for filename, core_bytes in self._core_files():
+                # The bitstreams are mostly high-entropy; store them as-is rather than spending
+                # most of the packaging time deflating them for a marginal size win.
+                file_info = zipfile.ZipInfo(filename)
+                file_info.compress_type = zipfile.ZIP_STORED
+                # Bit-reverse the bitstream chunk by chunk while it is being written, instead
+                # of materializing the entire reversed copy next to the original.
+                with archive.open(file_info, "w") as file:
+                    for offset in range(0, len(core_bytes), _RBF_CHUNK_SIZE):
+                        file.write(core_bytes[offset:offset + _RBF_CHUNK_SIZE].translate(_BITREV))